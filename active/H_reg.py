@@ -1,125 +1,297 @@
 import torch
 import numpy as np
 from tqdm import tqdm
-from typing import List, Dict, Union, Optional, Tuple
-from copy import deepcopy
+from typing import List, Dict, Union, Optional, Tuple, NamedTuple
 import random
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import math
+import weakref
 from gaussian_renderer import render, network_gui, modified_render
 from scene import Scene
 
 
+def acq_score(H, I_train, reg_lambda: torch.Tensor):
+    return torch.sum((H + reg_lambda) * I_train)
+
+
+class ParamLayout(NamedTuple):
+    all_params: Tuple[torch.Tensor, ...]
+    params: Tuple[torch.Tensor, ...]
+    offsets: List[int]
+    num_params: int
+
+
 class HRegSelector(torch.nn.Module):
+    # candidate Hessians are only used to rank views, so they are stored in half the memory
+    candidate_dtype = torch.bfloat16
+    score_chunk_size = 32
+    score_workers = 4
 
     def __init__(self, args) -> None:
         super().__init__()
         self.seed = args.seed
-        self.reg_lambda = args.reg_lambda
+        self.reg_lambda = float(args.reg_lambda)
         self.I_test: bool = args.I_test
         self.I_acq_reg: bool = args.I_acq_reg
+        self.num_streams: int = args.num_streams
+        self.hessian_batch_size: int = args.hessian_batch_size
+        self.debug: bool = args.debug_hreg
+        self.compile_acq: bool = args.compile_acq
+        self._acq_fn = None
+        self._streams: List[torch.cuda.Stream] = []
+        self._host_H: Optional[torch.Tensor] = None
+        self._ones: Dict[Tuple, torch.Tensor] = {}
+        self._score_pool: Optional[ThreadPoolExecutor] = None
+        self._param_cache = weakref.WeakKeyDictionary()
+        self._scalars: Dict[Tuple, torch.Tensor] = {}
 
         name2idx = {"xyz": 0, "rgb": 1, "sh": 2, "scale": 3, "rotation": 4, "opacity": 5}
         self.filter_out_idx: List[str] = [name2idx[k] for k in args.filter_out_grad]
 
     
     def nbvs(self, gaussians, scene: Scene, num_views, pipe, background, exit_func) -> List[int]:
-        candidate_views = list(deepcopy(scene.get_candidate_set()))
+        # get_candidate_set builds a new list of ints, there is nothing to deep copy
+        candidate_views = list(scene.get_candidate_set())
 
-        viewpoint_cams = scene.getTrainCameras().copy()
+        # already a copy
+        viewpoint_cams = scene.getTrainCameras()
 
         if self.I_test == True:
             viewpoint_cams = scene.getTestCameras()
 
-        params = gaussians.capture()[1:7]
-        params = [p for i, p in enumerate(params) if i not in self.filter_out_idx]
+        layout = self.param_layout(gaussians)
+
+        with self.grad_only_for(layout.all_params, layout.params):
+            return self.select_views(gaussians, scene, num_views, pipe, background, exit_func, layout, candidate_views, viewpoint_cams)
 
+    def param_layout(self, gaussians) -> ParamLayout:
+        """
+        Selected params and their offsets in the flat Hessian, cached until densification or a restore replaces the params
+        """
+        # same order as gaussians.capture()[1:7], without building the optimizer state dict
+        all_params = (gaussians._xyz, gaussians._features_dc, gaussians._features_rest,
+                      gaussians._scaling, gaussians._rotation, gaussians._opacity)
+        params = tuple(p for i, p in enumerate(all_params) if i not in self.filter_out_idx)
+
+        # only weak references are kept, so replaced params are not held alive between selections
+        cached = self._param_cache.get(gaussians)
+        if cached is None or any(ref() is not p for ref, p in zip(cached[0], all_params)):
+            offsets = np.cumsum([0] + [p.numel() for p in params]).tolist()
+            cached = (tuple(weakref.ref(p) for p in all_params), offsets[:-1], offsets[-1])
+            self._param_cache[gaussians] = cached
+        return ParamLayout(all_params, params, cached[1], cached[2])
+
+    @contextmanager
+    def grad_only_for(self, all_params, params):
+        """
+        Turn off requires_grad of the filtered out params, so the renders do not record their part of the graph
+        """
+        others = [p for p in all_params if not any(p is q for q in params)]
+        states = [p.requires_grad for p in others]
+        for p in others:
+            p.requires_grad_(False)
+        try:
+            yield
+        finally:
+            for p, state in zip(others, states):
+                p.requires_grad_(state)
+
+    def select_views(self, gaussians, scene: Scene, num_views, pipe, background, exit_func, layout, candidate_views, viewpoint_cams) -> List[int]:
+        params, num_params = layout.params, layout.num_params
         # off load to cpu to avoid oom with greedy algo
         device = params[0].device if num_views == 1 else "cpu"
         # device = "cpu" # we have to load to cpu because of inflation
 
-        H_train = torch.zeros(sum(p.numel() for p in params), device=params[0].device, dtype=params[0].dtype)
+        H_train = torch.zeros(num_params, device=params[0].device, dtype=params[0].dtype)
 
         candidate_cameras = scene.getCandidateCameras()
         # Run heesian on training set
-        for cam in tqdm(viewpoint_cams, desc="Calculating diagonal Hessian on training views"):
-            if exit_func():
-                raise RuntimeError("csm should exit early")
-
-            render_pkg = modified_render(cam, gaussians, pipe, background)
-            pred_img = render_pkg["render"]
-            pred_img.backward(gradient=torch.ones_like(pred_img))
-
-            cur_H = torch.cat([p.grad.detach().reshape(-1) for p in params])
-
-            H_train += cur_H
-
-            gaussians.optimizer.zero_grad(set_to_none = True) 
+        for _ in self.iter_hessians(viewpoint_cams, gaussians, pipe, background, layout, exit_func, H_train, accumulate=True,
+                                    desc="Calculating diagonal Hessian on training views"):
+            pass
 
         H_train = H_train.to(device)
 
         if num_views == 1:
-            return self.select_single_view(H_train, candidate_cameras, candidate_views, gaussians, pipe, background, params, exit_func)
-
-        H_candidates = []
-        for idx, cam in enumerate(tqdm(candidate_cameras, desc="Calculating diagonal Hessian on candidate views")):
-            if exit_func():
-                raise RuntimeError("csm should exit early")
-
-            render_pkg = modified_render(cam, gaussians, pipe, background)
-            pred_img = render_pkg["render"]
-            pred_img.backward(gradient=torch.ones_like(pred_img))
+            return self.select_single_view(H_train, candidate_cameras, candidate_views, gaussians, pipe, background, layout, exit_func)
 
-            cur_H = torch.cat([p.grad.detach().reshape(-1) for p in params])
+        H_stack = self.get_host_buffer(len(candidate_cameras), num_params)
+        for _ in self.iter_hessians(candidate_cameras, gaussians, pipe, background, layout, exit_func, H_stack,
+                                    desc="Calculating diagonal Hessian on candidate views"):
+            pass
+        # wait for the async copies before reading H_stack on host
+        torch.cuda.current_stream().synchronize()
 
-            H_candidates.append(cur_H.to(device))
-
-            gaussians.optimizer.zero_grad(set_to_none = True) 
-        
         selected_idxs = []
+        # selected candidates are masked out instead of popped so H_stack stays a single contiguous matrix
+        selected_mask = torch.zeros(len(candidate_views), dtype=torch.bool, device=H_stack.device)
+        # buffers reused by every greedy round
+        I_train = torch.empty_like(H_train)
+        acq_scores = torch.empty(len(candidate_views), dtype=H_train.dtype, device=H_train.device)
 
         for _ in range(num_views):
-            I_train = torch.reciprocal(H_train + self.reg_lambda)
+            torch.add(H_train, self.device_scalar(self.reg_lambda, H_train), out=I_train).reciprocal_()
+            self.score_candidates(H_stack, I_train, out=acq_scores)
             if self.I_acq_reg:
-                acq_scores = np.array([torch.sum((cur_H + self.I_acq_reg) * I_train).item() for cur_H in H_candidates])
-            else:
-                acq_scores = np.array([torch.sum(cur_H * I_train).item() for cur_H in H_candidates])
-            selected_idx = acq_scores.argmax()
-            selected_idxs.append(candidate_views.pop(selected_idx))
+                acq_scores += self.I_acq_reg * I_train.sum()
+            acq_scores.masked_fill_(selected_mask, float("-inf"))
+            selected_idx = int(acq_scores.argmax())
+            selected_idxs.append(candidate_views[selected_idx])
+            selected_mask[selected_idx] = True
 
-            H_train += H_candidates.pop(selected_idx)
+            H_train += H_stack[selected_idx]
 
         return selected_idxs
 
     
     def forward(self, x):
         return x
-    
-    
-    def select_single_view(self, I_train, candidate_cameras, candidate_views, gaussians, pipe, background, params, exit_func, num_views=1):
+
+    def score_candidates(self, H_stack, I_train, out):
         """
-        A memory effcient way when doing single view selection
+        out = H_stack @ I_train, rows are sharded over a thread pool since torch releases the GIL in the kernels
         """
-        I_train = torch.reciprocal(I_train + self.reg_lambda)
-        acq_scores = torch.zeros(len(candidate_cameras))
-
-        for idx, cam in enumerate(tqdm(candidate_cameras, desc="Calculating diagonal Hessian on candidate views")):
+        def score_shard(rows):
+            # upcast a few rows at a time, H_train and the scores stay in full precision
+            for chunk, dst in zip(H_stack[rows].split(self.score_chunk_size), out[rows].split(self.score_chunk_size)):
+                torch.mv(chunk.to(I_train.dtype), I_train, out=dst)
+
+        shard_size = max(1, math.ceil(len(H_stack) / self.score_workers))
+        shards = [slice(i, i + shard_size) for i in range(0, len(H_stack), shard_size)]
+        if self._score_pool is None:
+            self._score_pool = ThreadPoolExecutor(max_workers=self.score_workers)
+        # list() re-raises the exceptions of the workers
+        list(self._score_pool.map(score_shard, shards))
+        return out
+
+    def device_scalar(self, value: float, like: torch.Tensor) -> torch.Tensor:
+        # 0-dim tensors are built once and passed to compiled kernels as inputs instead of baked in constants
+        key = (value, like.device, like.dtype)
+        if key not in self._scalars:
+            self._scalars[key] = torch.tensor(value, device=like.device, dtype=like.dtype)
+        return self._scalars[key]
+
+    def get_ones(self, pred_img) -> torch.Tensor:
+        # backward only reads the gradient, one contiguous ones image per shape is shared by every view
+        key = (pred_img.shape, pred_img.device, pred_img.dtype)
+        if key not in self._ones:
+            self._ones[key] = torch.ones_like(pred_img, memory_format=torch.contiguous_format)
+        return self._ones[key]
+
+    def get_host_buffer(self, num_rows, num_params) -> torch.Tensor:
+        """
+        Pinned host buffer for candidate Hessians, reused across selections so it is only reallocated when it grows
+        """
+        numel = num_rows * num_params
+        if self._host_H is None or self._host_H.numel() < numel:
+            self._host_H = None
+            self._host_H = torch.empty(numel, dtype=self.candidate_dtype, pin_memory=True)
+        return self._host_H[:numel].view(num_rows, num_params)
+
+    def get_streams(self) -> List[torch.cuda.Stream]:
+        if len(self._streams) != self.num_streams:
+            self._streams = [torch.cuda.Stream() for _ in range(self.num_streams)]
+        return self._streams
+
+    def iter_hessians(self, cameras, gaussians, pipe, background, layout, exit_func, out, accumulate=False, desc=None):
+        """
+        Write the diagonal Hessian of each camera into `out` and yield (idx, Hessian). `out` is either a flat buffer,
+        added into if `accumulate` else overwritten, or a (num_cameras, num_params) buffer filled row by row.
+        When accumulating, `hessian_batch_size` views are rendered per pass and idx counts passes. The default of 1 keeps
+        a single render graph alive, the peak memory the cpu offloading of this path is sized for, larger batches are opt-in.
+        The reduction of each view is issued round-robin on a pool of side streams, so it overlaps the render and
+        backward of the next view.
+        """
+        params, offsets = layout.params, layout.offsets
+        streams = self.get_streams()
+        main_stream = torch.cuda.current_stream()
+        for s in streams:
+            s.wait_stream(main_stream)
+
+        prev_event = None
+        # Hessians are additive over views, when accumulating several views share one autograd call
+        views_per_pass = self.hessian_batch_size if accumulate else 1
+        batches = [cameras[i:i + views_per_pass] for i in range(0, len(cameras), views_per_pass)]
+        for idx, batch in enumerate(tqdm(batches, desc=desc)):
             if exit_func():
                 raise RuntimeError("csm should exit early")
 
-            render_pkg = modified_render(cam, gaussians, pipe, background)
-            pred_img = render_pkg["render"]
-            pred_img.backward(gradient=torch.ones_like(pred_img))
-
-            cur_H = torch.cat([p.grad.detach().reshape(-1) for p in params])
-
-            I_acq = cur_H
-
-            if self.I_acq_reg:
-                I_acq += self.reg_lambda
-
-            gaussians.optimizer.zero_grad(set_to_none = True) 
-            acq_scores[idx] += torch.sum(I_acq * I_train).item()
+            # the rasterizer launches its kernels on the legacy default stream whatever the current stream is,
+            # so the render and its backward stay on the main stream and only the reduction goes to a side stream
+            render_pkgs = [modified_render(cam, gaussians, pipe, background) for cam in batch]
+            # no gaussian is visible in a view means its Hessian is zero, skip its backward
+            pred_imgs = [pkg["render"] for pkg in render_pkgs if pkg["visibility_filter"].any()]
+
+            grads = None
+            if len(pred_imgs) > 0:
+                # same as backward with a ones gradient, but the grads are returned instead of written to .grad
+                grads = torch.autograd.grad(pred_imgs, params, grad_outputs=[self.get_ones(p) for p in pred_imgs],
+                                            retain_graph=False, create_graph=False)
+            # free the images, depth and counters now rather than when the next view overwrites them
+            del render_pkgs, pred_imgs
+            grads_ready = main_stream.record_event()
+
+            stream = streams[idx % len(streams)]
+            with torch.cuda.stream(stream):
+                stream.wait_event(grads_ready)
+                # a flat `out` is shared by all views, wait until the previous view is consumed
+                if prev_event is not None:
+                    stream.wait_event(prev_event)
+                cur_H = out[idx] if out.dim() == 2 else out
+                if grads is None and not accumulate:
+                    cur_H.zero_()
+                for off, g in zip(offsets, grads or ()):
+                    # g belongs to the main stream, do not let the allocator reuse it before this stream is done
+                    g.record_stream(stream)
+                    dst = cur_H.narrow(0, off, g.numel())
+                    if accumulate:
+                        dst.add_(g.reshape(-1))
+                    else:
+                        dst.copy_(g.reshape(-1), non_blocking=True)
+
+                # the caller consumes cur_H on this stream as well
+                yield idx, cur_H
+                prev_event = stream.record_event()
+
+        for s in streams:
+            main_stream.wait_stream(s)
+    
+    
+    def acq_score(self, H, I_train, reg_lambda):
+        """
+        acq_score, compiled on first use with --compile_acq, the eager function is used if the backend is missing
+        """
+        if self._acq_fn is None:
+            # fuse the regularization into the reduction so H and I_train are read once
+            compiled = self.compile_acq and hasattr(torch, "compile")
+            self._acq_fn = torch.compile(acq_score, dynamic=True) if compiled else acq_score
+        if self._acq_fn is acq_score:
+            return acq_score(H, I_train, reg_lambda)
+        try:
+            return self._acq_fn(H, I_train, reg_lambda)
+        except Exception as e:
+            # torch.compile only builds the kernel on the first call, that is where a missing triton shows up
+            print(f"[WARNING] compiling acq_score failed, falling back to eager: {e}")
+            self._acq_fn = acq_score
+            return acq_score(H, I_train, reg_lambda)
+
+    def select_single_view(self, I_train, candidate_cameras, candidate_views, gaussians, pipe, background, layout, exit_func, num_views=1):
+        """
+        A memory effcient way when doing single view selection
+        """
+        I_train = torch.reciprocal(I_train + self.device_scalar(self.reg_lambda, I_train))
+        acq_reg = self.device_scalar(self.reg_lambda if self.I_acq_reg else 0., I_train)
+        # keep the scores on device, so there is a single sync after all candidates are scored
+        acq_scores = torch.zeros(len(candidate_cameras), device=I_train.device, dtype=I_train.dtype)
+        H_scratch = torch.empty_like(I_train)
+
+        for idx, cur_H in self.iter_hessians(candidate_cameras, gaussians, pipe, background, layout, exit_func, H_scratch,
+                                             desc="Calculating diagonal Hessian on candidate views"):
+            acq_scores[idx] = self.acq_score(cur_H, I_train, acq_reg)
         
-        print(f"acq_scores: {acq_scores.tolist()}")
+        if self.debug:
+            print(f"acq_scores: {acq_scores.tolist()}")
         if self.I_test == True:
             acq_scores *= -1
 
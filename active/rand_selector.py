@@ -1,7 +1,6 @@
 import torch
 import numpy as np
 from typing import List, Dict, Union, Optional
-from copy import deepcopy
 import random
 
 class RandSelector(torch.nn.Module):
@@ -12,7 +11,7 @@ class RandSelector(torch.nn.Module):
 
     
     def nbvs(self, gaussian, scene, num_views, *args, **kwargs) -> List[int]:
-        candidate_views = deepcopy(list(scene.get_candidate_set()))
+        candidate_views = list(scene.get_candidate_set())
         random.Random(self.seed).shuffle(candidate_views)
 
         return candidate_views[:num_views]
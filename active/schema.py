@@ -70,25 +70,25 @@ class VNSeqMInplace(BaseSchema):
         
         # NOTE: following the default implementation of scene. 
         # result of getTrainCameras are shuffled in-place, thus we have to rely on train_idxs to index the views
-        all_cams = scene.train_cameras[1.0]
-        candidate_views = [i for i in range(len(all_cams)) if i not in self.init_views]
-        train_cams = [all_cams[i] for i in self.init_views]
-        candidate_cams = [all_cams[i] for i in candidate_views]
+        # centers of all the views gathered on the device and copied to host at once, instead of one copy per camera
+        all_centers = scene.getTrainCameraCenters(1.0).cpu()
+        candidate_views = [i for i in range(len(all_centers)) if i not in self.init_views]
 
         selected_idxs = []
 
-        for _ in range(num_init_views_needed):
-            trainT = torch.stack([i.camera_center.cpu() for i in train_cams])
-            candidateT = torch.stack([i.camera_center.cpu() for i in candidate_cams])
-
-            dist_mat = torch.cdist(candidateT, trainT)
-            candidate_dist = reduce(dist_mat, "c t -> c", "min")
+        trainT = all_centers[self.init_views]
+        candidateT = all_centers[candidate_views]
+        # distance of each candidate to its closest training cam, updated with every pick instead of recomputed
+        candidate_dist = reduce(torch.cdist(candidateT, trainT), "c t -> c", "min")
 
+        for _ in range(num_init_views_needed):
             selected_idx = candidate_dist.argmax().item()
-            selected_idxs.append(candidate_views.pop(selected_idx))
+            selected_idxs.append(candidate_views[selected_idx])
 
-            # Put selected cam into training cam
-            train_cams.append(candidate_cams.pop(selected_idx))
+            # Put selected cam into training cam, it is masked out instead of popped from the candidates
+            new_dist = torch.cdist(candidateT, candidateT[selected_idx:selected_idx + 1])[:, 0]
+            candidate_dist = torch.minimum(candidate_dist, new_dist)
+            candidate_dist[selected_idx] = -1
         
         self.init_views.extend(selected_idxs)
 
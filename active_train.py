@@ -1,9 +1,14 @@
 import os
 import torch
-from random import randint
 from utils.loss_utils import l1_loss, ssim
 from gaussian_renderer import render, network_gui, modified_render
 import sys
+import io
+import torch.multiprocessing as mp
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+import logging
 from scene import Scene, GaussianModel
 from utils.general_utils import safe_state
 import uuid
@@ -22,26 +27,145 @@ try:
 except ImportError:
     TENSORBOARD_FOUND = False
 from utils.cluster_manager import ClusterStateManager
+from utils.dist_utils import (init_distributed, is_main_process, get_rank, get_world_size, barrier, all_reduce_grads,
+                              all_reduce_densification_stats, broadcast_object, any_rank)
+from datetime import timedelta
+from utils.checkpoint_utils import SAFETENSORS_FOUND, save_safetensors, load_safetensors, is_safetensors
 
 csm = ClusterStateManager()
+logger = logging.getLogger(__name__)
+
+def requeue():
+    # only the main process asks slurm to requeue the job, the other ranks just exit with it
+    if is_main_process():
+        csm.requeue()
+    elif csm.on_cluster:
+        sys.exit(csm.get_exit_code())
+# mmap needs torch >= 2.1, checkpoints hold python scalars and lists so they are not weights only
+TORCH_LOAD_KWARGS = {k: v for k, v in {"mmap": True, "weights_only": False}.items()
+                     if k in inspect.signature(torch.load).parameters}
+
+def to_host(obj, host_buffer):
+    """
+    Non-blocking copy of the cuda tensors of a checkpoint into the pinned buffers given by `host_buffer`
+    """
+    if isinstance(obj, torch.Tensor):
+        if not obj.is_cuda:
+            return obj.clone()
+        host = host_buffer(obj).copy_(obj, non_blocking=True)
+        # restore() assigns the loaded params directly, keep them nn.Parameter
+        return torch.nn.Parameter(host, requires_grad=obj.requires_grad) if isinstance(obj, torch.nn.Parameter) else host
+    if isinstance(obj, dict):
+        return {k: to_host(v, host_buffer) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_host(v, host_buffer) for v in obj)
+    return obj
+
+def to_device(obj, device):
+    if isinstance(obj, torch.Tensor):
+        moved = obj.to(device)
+        return torch.nn.Parameter(moved, requires_grad=obj.requires_grad) if isinstance(obj, torch.nn.Parameter) else moved
+    if isinstance(obj, dict):
+        return {k: to_device(v, device) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_device(v, device) for v in obj)
+    return obj
+
+# checkpoints are written with safetensors when it is installed, unless --legacy_ckpt asks for torch.save
+USE_SAFETENSORS = SAFETENSORS_FOUND
+# single writer thread, checkpoints are written in order and the future re-raises errors of the write
+_ckpt_executor = None
+_ckpt_writer = None
+_ckpt_copied = None
+_ckpt_stream = None
+# pinned buffers of the last checkpoint, in capture() order, reused while the shapes do not change
+_ckpt_host_buffers = []
+
+def wait_checkpoint():
+    """
+    Block until the checkpoint being written in the background is on disk, re-raises the error if the write failed
+    """
+    global _ckpt_writer
+    if _ckpt_writer is not None:
+        writer, _ckpt_writer = _ckpt_writer, None
+        writer.result()
+
+def wait_checkpoint_copies():
+    """
+    Make the current stream wait for the device to host copies of the last checkpoint, call before updating the state
+    """
+    global _ckpt_copied
+    if _ckpt_copied is not None:
+        torch.cuda.current_stream().wait_event(_ckpt_copied)
+        _ckpt_copied = None
 
 @torch.no_grad()
 def save_checkpoint(gaussians, iteration, scene, base_iter=0, save_path=None, save_last=True):
-    ckpt_dict = {"model_params": gaussians.capture(), "first_iter": iteration, "train_idx": scene.train_idxs, "base_iter": base_iter}
-
+    """
+    Snapshot the state to host on a side stream and write it from a background thread, training continues during
+    the copies, the pickle and the disk write
+    """
+    global _ckpt_executor, _ckpt_writer, _ckpt_copied, _ckpt_stream
+    # one checkpoint in flight at a time, so writes of last.pth land in order and the host buffers are free
+    wait_checkpoint()
+    if _ckpt_stream is None:
+        _ckpt_stream = torch.cuda.Stream()
+    _ckpt_stream.wait_stream(torch.cuda.current_stream())
+
+    slot = itertools.count()
+    def host_buffer(src):
+        i = next(slot)
+        if i == len(_ckpt_host_buffers):
+            _ckpt_host_buffers.append(None)
+        buf = _ckpt_host_buffers[i]
+        if buf is None or buf.shape != src.shape or buf.dtype != src.dtype:
+            buf = _ckpt_host_buffers[i] = torch.empty(src.shape, dtype=src.dtype, pin_memory=True)
+        # src belongs to the main stream, do not let the allocator reuse it before the copy is done
+        src.record_stream(_ckpt_stream)
+        return buf
+
+    with torch.cuda.stream(_ckpt_stream):
+        model_params = to_host(gaussians.capture(), host_buffer)
+        copied = _ckpt_stream.record_event()
+    # the training stream only waits for the copies once it is about to update the state (wait_checkpoint_copies)
+    _ckpt_copied = copied
+    ckpt_dict = {"model_params": model_params, "first_iter": iteration, "train_idx": list(scene.train_idxs), "base_iter": base_iter}
+
+    paths = []
     if save_last:
-        last_path = scene.model_path + "/last.pth"
-        print("\n[ITER {}] Saving Checkpoint to {}".format(iteration, last_path))
-        torch.save(ckpt_dict, last_path)   
-
+        paths.append(scene.model_path + "/last.pth")
     if save_path is None:
         save_path = scene.model_path + "/chkpnt" + str(iteration) + ".pth"
-    print("\n[ITER {}] Saving Checkpoint to {}".format(iteration, save_path))
-    torch.save(ckpt_dict, save_path)   
+    paths.append(save_path)
+
+    def write():
+        copied.synchronize()
+        # serialized once, last.pth and the numbered checkpoint get the same bytes
+        if USE_SAFETENSORS:
+            data = save_safetensors(ckpt_dict)
+        else:
+            buf = io.BytesIO()
+            torch.save(ckpt_dict, buf)
+            data = buf.getbuffer()
+        for path in paths:
+            print("\n[ITER {}] Saving Checkpoint to {}".format(iteration, path))
+            with open(path, "wb") as f:
+                f.write(data)
+
+    if _ckpt_executor is None:
+        _ckpt_executor = ThreadPoolExecutor(max_workers=1)
+    _ckpt_writer = _ckpt_executor.submit(write)
 
 def load_checkpoint(ckpt_path: str, gaussians, scene, opt, ignore_train_idxs=False):
-    ckpt_dict = torch.load(ckpt_path)
+    wait_checkpoint()
+    # checkpoints are written from host memory, mapped instead of read into a private host copy when supported
+    if is_safetensors(ckpt_path):
+        ckpt_dict = load_safetensors(ckpt_path)
+    else:
+        ckpt_dict = torch.load(ckpt_path, **TORCH_LOAD_KWARGS)
     (model_params, first_iter, train_idxs) = ckpt_dict["model_params"], ckpt_dict["first_iter"], ckpt_dict["train_idx"]
+    # the optimizer state dict is left as is, load_state_dict moves it to the params and keeps Adam's step on the host
+    model_params = tuple(p if isinstance(p, dict) else to_device(p, "cuda") for p in model_params)
     gaussians.restore(model_params, opt)
     if not ignore_train_idxs:
         scene.train_idxs = train_idxs
@@ -50,10 +174,27 @@ def load_checkpoint(ckpt_path: str, gaussians, scene, opt, ignore_train_idxs=Fal
     return first_iter, base_iter
 
 
+def image_loss(image, gt_image, lambda_dssim: float):
+    Ll1 = l1_loss(image, gt_image)
+    loss = (1.0 - lambda_dssim) * Ll1
+    # the ssim convolutions are skipped entirely when the term has no weight
+    if lambda_dssim != 0:
+        loss = loss + lambda_dssim * (1.0 - ssim(image, gt_image))
+    return Ll1, loss
+
 def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, args):
+    global USE_SAFETENSORS
+    USE_SAFETENSORS = SAFETENSORS_FOUND and not args.legacy_ckpt
+    # image sizes are fixed per scene, let cudnn pick the fastest algorithm for the ssim convolutions
+    torch.backends.cudnn.benchmark = True
+    torch.set_float32_matmul_precision('high')
+    # only the loss is compiled, the rasterizer is an opaque extension call with data dependent allocations
+    compute_loss = torch.compile(image_loss) if args.compile and hasattr(torch, "compile") else image_loss
     first_iter = 0
     base_iter = 0
-    tb_writer = prepare_output_and_logger(dataset)
+    tb_writer = prepare_output_and_logger(dataset) if is_main_process() else None
+    # the output folder is created by the main process, the other ranks wait for it before building the scene
+    barrier()
     gaussians = GaussianModel(dataset.sh_degree)
     scene = Scene(dataset, gaussians)
     gaussians.training_setup(opt)
@@ -73,17 +214,29 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
             print(f"[WARNING] checkpoint {checkpoint} doesn't exist, training from scratch")
 
     if first_iter == 0: # maybe init_ckpt has been save if preempted
-        save_checkpoint(gaussians, first_iter, scene, base_iter, save_path=init_ckpt_path, save_last=False)
+        if is_main_process():
+            save_checkpoint(gaussians, first_iter, scene, base_iter, save_path=init_ckpt_path, save_last=False)
+            if get_world_size() > 1:
+                wait_checkpoint()
+        # the other ranks load init.ckpt at the first selection
+        barrier()
 
     bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
     background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
 
-    iter_start = torch.cuda.Event(enable_timing = True)
-    iter_end = torch.cuda.Event(enable_timing = True)
+    # a ring of timing events, the iteration time is read from the oldest pair so elapsed_time does not stall on the GPU
+    timer_ring = [(torch.cuda.Event(enable_timing = True), torch.cuda.Event(enable_timing = True)) for _ in range(10)]
 
+    # point clouds are written by a single background worker, so saving does not stall the training step
+    save_executor = ThreadPoolExecutor(max_workers=1)
+    pending_saves = []
+
+    # with several ranks each one draws its own views, the global RNG stays in lockstep for densification
+    view_rng = torch.Generator().manual_seed(args.seed + get_rank()) if get_world_size() > 1 else None
     viewpoint_stack = None
     ema_loss_for_log = 0.0
-    progress_bar = tqdm(range(first_iter, opt.iterations), desc="Training progress")
+    ema_loss_gpu = torch.zeros((), device="cuda")
+    progress_bar = tqdm(range(first_iter, opt.iterations), desc="Training progress", disable=not is_main_process())
     first_iter += 1
     for iteration in range(first_iter, opt.iterations + 1):        
         if network_gui.conn == None:
@@ -103,19 +256,25 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
         num_views = schema.num_views_to_add(iteration)
         if num_views > 0:
-            try:
-                # For sectioned training
-                candidate_views_filter = getattr(schema, "candidate_views_filter")[iteration] if hasattr(schema, "candidate_views_filter") else None
-                scene.candidate_views_filter = candidate_views_filter
-                
-                # Because selection is time consumeing
-                selected_views = active_method.nbvs(gaussians, scene, num_views, pipe, background, exit_func=csm.should_exit)
-            except RuntimeError as e:
-                print(e)
-                print("selector exited early")
+            # For sectioned training
+            candidate_views_filter = getattr(schema, "candidate_views_filter")[iteration] if hasattr(schema, "candidate_views_filter") else None
+            scene.candidate_views_filter = candidate_views_filter
+            # replicas are identical, the main process selects and the other ranks receive its views
+            selected_views = None
+            if is_main_process():
+                try:
+                    # Because selection is time consumeing
+                    selected_views = active_method.nbvs(gaussians, scene, num_views, pipe, background, exit_func=csm.should_exit)
+                except RuntimeError as e:
+                    print(e)
+                    print("selector exited early")
+            selected_views = broadcast_object(selected_views)
+            if selected_views is None:
                 # NOTE: we use iteration - 1 because the selector is not done
-                save_checkpoint(gaussians, iteration - 1, scene)
-                csm.requeue()
+                if is_main_process():
+                    save_checkpoint(gaussians, iteration - 1, scene)
+                    wait_checkpoint()
+                requeue()
 
             print(f"ITER {iteration}: selected views: {selected_views}")
             scene.train_idxs.extend(selected_views)
@@ -126,6 +285,7 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
             first_iter, _ = load_checkpoint(init_ckpt_path, gaussians, scene, opt, ignore_train_idxs=True)
             base_iter = iteration - 1
 
+        iter_start, iter_end = timer_ring[iteration % len(timer_ring)]
         iter_start.record()
 
         gaussians.update_learning_rate(iteration - base_iter)
@@ -135,32 +295,48 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
         # Pick a random Camera
         if not viewpoint_stack:
-            viewpoint_stack = scene.getTrainCameras().copy()
-        viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
+            # shuffled once per pass, so each pick is an O(1) pop from the tail
+            train_cams = scene.getTrainCameras()
+            viewpoint_stack = [train_cams[i] for i in torch.randperm(len(train_cams), generator=view_rng).tolist()]
+        viewpoint_cam = viewpoint_stack.pop()
 
         # Render
         if (iteration - 1) == debug_from:
             pipe.debug = True
-        render_pkg = render(viewpoint_cam, gaussians, pipe, background)
+        # stays on the current stream: the rasterizer launches on the legacy default stream and blocks on a memcpy of
+        # num_rendered, so wrapping it in a side stream does not overlap views and races with the caller's kernels
+        # the screen-space gradients only feed the densification stats
+        render_pkg = render(viewpoint_cam, gaussians, pipe, background, track_viewspace_grad=iteration - base_iter < opt.densify_until_iter)
         image, viewspace_point_tensor, visibility_filter, radii = render_pkg["render"], render_pkg["viewspace_points"], render_pkg["visibility_filter"], render_pkg["radii"]
 
         # Loss
-        gt_image = viewpoint_cam.original_image.cuda()
-        Ll1 = l1_loss(image, gt_image)
-        loss = (1.0 - opt.lambda_dssim) * Ll1 + opt.lambda_dssim * (1.0 - ssim(image, gt_image))
+        gt_image = viewpoint_cam.original_image.to("cuda", non_blocking=True)
+        # the rasterizer kernels are fp32 only, autocast covers the loss alone
+        with torch.autocast("cuda", dtype=torch.bfloat16, enabled=args.amp):
+            Ll1, loss = compute_loss(image, gt_image, opt.lambda_dssim)
         loss.backward()
+        # average over the views rendered by all ranks
+        all_reduce_grads([p for group in gaussians.optimizer.param_groups for p in group["params"]])
 
         iter_end.record()
 
         # We save before logging
-        if csm.should_exit():
-            save_checkpoint(gaussians, iteration - 1, scene)
-            csm.requeue()
+        if any_rank(csm.should_exit()):
+            if is_main_process():
+                save_checkpoint(gaussians, iteration - 1, scene)
+                wait_checkpoint()
+            requeue()
 
         with torch.no_grad():
             # Progress bar
-            ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
+            # the EMA is kept on device and only read back when it is displayed
+            ema_loss_gpu.mul_(0.6).add_(loss.detach(), alpha=0.4)
+            elapsed = None
             if iteration % 10 == 0:
+                ema_loss_for_log = ema_loss_gpu.item()
+                oldest_start, oldest_end = timer_ring[(iteration + 1) % len(timer_ring)]
+                if iteration - first_iter >= len(timer_ring) and oldest_end.query():
+                    elapsed = oldest_start.elapsed_time(oldest_end)
                 progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}"})
                 progress_bar.update(10)
             if iteration == opt.iterations:
@@ -168,36 +344,53 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
             before_selection = schema.num_views_to_add(iteration + 1) > 0
             # Log and save
-            training_report(tb_writer, iteration, Ll1, loss, l1_loss, iter_start.elapsed_time(iter_end), 
-                            testing_iterations, scene, render, (pipe, background), before_selection=before_selection, 
-                            log_every_image=args.log_every_image)
-            if (iteration in saving_iterations):
+            if is_main_process():
+                training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, 
+                                testing_iterations, scene, render, (pipe, background), before_selection=before_selection, 
+                                log_every_image=args.log_every_image, empty_cache=args.empty_cache_on_eval)
+            if (iteration in saving_iterations) and is_main_process():
                 print("\n[ITER {}] Saving Gaussians".format(iteration))
-                scene.save(iteration)
+                pending_saves.append(scene.save(iteration, executor=save_executor))
 
+            # Densification and the optimizer step below update the state a checkpoint may still be copying
+            wait_checkpoint_copies()
             # Densification
             cur_iter = iteration - base_iter
             if cur_iter < opt.densify_until_iter:
                 # Keep track of max radii in image-space for pruning
-                gaussians.max_radii2D[visibility_filter] = torch.max(gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
+                # visibility_filter is radii > 0 and max_radii2D starts at 0, so a dense in-place max is the same masked update
+                # without the three boolean gathers and the host sync on the mask count
+                torch.maximum(gaussians.max_radii2D, radii, out=gaussians.max_radii2D)
                 gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
 
                 if cur_iter > opt.densify_from_iter and cur_iter % opt.densification_interval == 0:
+                    all_reduce_densification_stats(gaussians)
                     size_threshold = 20 if cur_iter > opt.opacity_reset_interval else None
-                    gaussians.densify_and_prune(opt.densify_grad_threshold, args.min_opacity, scene.cameras_extent, size_threshold)
+                    gaussians.densify_and_prune(opt.densify_grad_threshold, args.min_opacity, scene.cameras_extent, size_threshold, empty_cache=False)
                 
                 if cur_iter % opt.opacity_reset_interval == 0 or (dataset.white_background and cur_iter == opt.densify_from_iter):
-                    print(f"\nreset_opacity at {cur_iter}, base_iter")
+                    logger.debug("reset_opacity at %d, base_iter %d", cur_iter, base_iter)
                     gaussians.reset_opacity()
 
             # Optimizer step
             if iteration < opt.iterations:
                 gaussians.optimizer.step()
                 gaussians.optimizer.zero_grad(set_to_none = True)
+
+            # the only place the training loop returns cached blocks, off unless asked for
+            if args.empty_cache_every and iteration % args.empty_cache_every == 0:
+                torch.cuda.empty_cache()
         
-        if (iteration in checkpoint_iterations):
+        if (iteration in checkpoint_iterations) and is_main_process():
             save_checkpoint(gaussians, iteration, scene)
-    wandb.finish()
+    wait_checkpoint()
+    # re-raises errors of the background writes
+    for save in pending_saves:
+        save.result()
+    save_executor.shutdown(wait=True)
+    # wandb is only initialized on the main process in run()
+    if is_main_process():
+        wandb.finish()
 
         
 
@@ -223,50 +416,87 @@ def prepare_output_and_logger(args):
         print("Tensorboard not available: not logging progress")
     return tb_writer
 
-def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_iterations, scene : Scene, renderFunc, renderArgs, before_selection=False, log_every_image=False):
-    if tb_writer:
+_LPIPS_CACHE = {}
+# (config name, view index) of the ground truth images already written, they do not change between evaluations
+_GT_LOGGED = set()
+
+def to_uint8(image):
+    # tensorboard encodes uint8 images directly, float ones are rescaled and converted on the cpu first
+    return (image * 255 + 0.5).to(torch.uint8)
+# views scored per metric call in training_report, bounded by the LPIPS activations at full resolution
+EVAL_BATCH_SIZE = 4
+
+def batch_metrics(images, gt_images, lpips):
+    """
+    Per-view l1, psnr, ssim and lpips of a batch of same-sized views, summed over the batch
+    """
+    image, gt_image = torch.stack(images), torch.stack(gt_images)
+    # l1_loss averages over the whole batch and LPIPS already sums over it, psnr is taken per channel and averaged per
+    # view as it was on single (3, H, W) views
+    view_psnr = psnr(image.flatten(0, 1), gt_image.flatten(0, 1)).view(len(images), -1).mean(1)
+    return torch.stack([l1_loss(image, gt_image) * len(images), view_psnr.sum(),
+                        ssim(image, gt_image, size_average=False).sum(), lpips(image, gt_image).sum()]).double()
+
+# eval renders and metrics never backpropagate, inference mode also skips the version counter and view tracking
+@torch.inference_mode()
+def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_iterations, scene : Scene, renderFunc, renderArgs, before_selection=False, log_every_image=False, empty_cache=False):
+    # reading the losses back syncs with the GPU, only done at the progress bar cadence
+    if tb_writer and iteration % 10 == 0:
         tb_writer.add_scalar('train_loss_patches/l1_loss', Ll1.item(), iteration)
         tb_writer.add_scalar('train_loss_patches/total_loss', loss.item(), iteration)
-        tb_writer.add_scalar('iter_time', elapsed, iteration)
+        if elapsed is not None:
+            tb_writer.add_scalar('iter_time', elapsed, iteration)
 
     # Report test and samples of training set
     if iteration in testing_iterations or before_selection:
         print(f"Running evaluation for iteration: {iteration}")
-        torch.cuda.empty_cache()
-        lpips = lpips_func("cuda", net_type='vgg')
+        # the caching allocator reuses the blocks of the training step, only flush it when memory is tight
+        if empty_cache:
+            torch.cuda.empty_cache()
+        # the VGG backed LPIPS is built once and kept for later evaluations
+        if ("vgg", "cuda") not in _LPIPS_CACHE:
+            _LPIPS_CACHE[("vgg", "cuda")] = lpips_func("cuda", net_type='vgg')
+        lpips = _LPIPS_CACHE[("vgg", "cuda")]
+        train_cameras = scene.getTrainCameras()
         validation_configs = ({'name': 'test', 'cameras' : scene.getTestCameras()}, 
-                              {'name': 'train', 'cameras' : [scene.getTrainCameras()[idx % len(scene.getTrainCameras())] for idx in range(5, 30, 5)]})
+                              {'name': 'train', 'cameras' : [train_cameras[idx % len(train_cameras)] for idx in range(5, 30, 5)]})
 
         for config in validation_configs:
             if config['cameras'] and len(config['cameras']) > 0:
-                l1_test = 0.0
-                psnr_test = 0.0
-                ssim_test = 0.0
-                lpips_test = 0.0
+                # l1, psnr, ssim and lpips summed on device, read back once after the loop
+                metrics_sum = torch.zeros(4, dtype=torch.float64, device="cuda")
 
                 log_images = {}
+                images, gt_images = [], []
                 for idx, viewpoint in enumerate(config['cameras']):
-                    image = torch.clamp(renderFunc(viewpoint, scene.gaussians, *renderArgs)["render"], 0.0, 1.0)
-                    gt_image = torch.clamp(viewpoint.original_image.to("cuda"), 0.0, 1.0)
+                    image = torch.clamp(renderFunc(viewpoint, scene.gaussians, *renderArgs, track_viewspace_grad=False)["render"], 0.0, 1.0)
+                    gt_image = torch.clamp(viewpoint.original_image.to("cuda", non_blocking=True), 0.0, 1.0)
                     if tb_writer and ((idx < 5) or log_every_image):
-                        tb_writer.add_images(config['name'] + "_view_{}/render".format(idx), image[None], global_step=iteration)
-                        log_images[f"render/{idx:03d}"] = wandb.Image(image[None])
-                        if iteration == testing_iterations[0]:
-                            tb_writer.add_images(config['name'] + "_view_{}/ground_truth".format(idx), gt_image[None], global_step=iteration)
-                            log_images[f"gt/{idx:03d}"] = wandb.Image(gt_image.cpu()[None])
-                    l1_test += l1_loss(image, gt_image).mean().double()
-                    psnr_test += psnr(image, gt_image).mean().double()
-                    ssim_test += ssim(image, gt_image).mean().double()
-                    lpips.to(image.device)
-                    lpips_test += lpips(image, gt_image).mean().double()
+                        tb_writer.add_images(config['name'] + "_view_{}/render".format(idx), to_uint8(image)[None], global_step=iteration)
+                        # the wandb images are only sent with log_every_image, skip building them otherwise
+                        if log_every_image:
+                            log_images[f"render/{idx:03d}"] = wandb.Image(image[None])
+                        if (config['name'], idx) not in _GT_LOGGED:
+                            _GT_LOGGED.add((config['name'], idx))
+                            tb_writer.add_images(config['name'] + "_view_{}/ground_truth".format(idx), to_uint8(gt_image)[None], global_step=iteration)
+                            if log_every_image:
+                                log_images[f"gt/{idx:03d}"] = wandb.Image(gt_image.cpu()[None])
+                    # score a few views per metric call, flushing early if the resolution changes
+                    if images and images[0].shape != image.shape:
+                        metrics_sum += batch_metrics(images, gt_images, lpips)
+                        images, gt_images = [], []
+                    images.append(image)
+                    gt_images.append(gt_image)
+                    if len(images) == EVAL_BATCH_SIZE:
+                        metrics_sum += batch_metrics(images, gt_images, lpips)
+                        images, gt_images = [], []
+                if images:
+                    metrics_sum += batch_metrics(images, gt_images, lpips)
 
                 if log_every_image:
                     wandb.log(log_images, step=iteration)
 
-                psnr_test /= len(config['cameras'])
-                l1_test /= len(config['cameras'])          
-                ssim_test /= len(config['cameras'])
-                lpips_test /= len(config['cameras'])
+                l1_test, psnr_test, ssim_test, lpips_test = (metrics_sum / len(config['cameras'])).tolist()
 
                 print("\n[ITER {}] Evaluating {}: L1 {} PSNR {} SSIM {} LPIPS {}".format(iteration, config['name'], l1_test, psnr_test, ssim_test, lpips_test))
                 if tb_writer:
@@ -282,7 +512,8 @@ def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_i
             tb_writer.add_histogram("scene/opacity_histogram", scene.gaussians.get_opacity, iteration)
             tb_writer.add_scalar('total_points', scene.gaussians.get_xyz.shape[0], iteration)
             wandb.log({'total_points': scene.gaussians.get_xyz.shape[0]}, step=iteration)
-        torch.cuda.empty_cache()
+        if empty_cache:
+            torch.cuda.empty_cache()
 
 import socket
 from contextlib import closing
@@ -293,6 +524,35 @@ def find_free_port():
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         return s.getsockname()[1]
 
+def run(rank, world_size, init_method, args, dataset, opt, pipe):
+    """
+    Entry point of a training process, one per gpu when running distributed
+    """
+    # configured here rather than in __main__ so spawned ranks get it too
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    # Initialize system state (RNG)
+    # same seed on every rank, densification draws the same samples on all replicas, each rank on its own gpu
+    safe_state(args.quiet, seed=args.seed, device=torch.device("cuda", rank))
+
+    if world_size > 1:
+        # selection on the main process can take long, the other ranks wait for it in a collective
+        init_distributed(rank, world_size, init_method, timeout=timedelta(hours=4))
+
+    if is_main_process():
+        wandb.init(project='active', resume="allow", id=os.path.split(args.model_path.rstrip('/'))[-1], config=vars(args))
+
+    # Start GUI server, configure and run training
+    if is_main_process():
+        args.port = find_free_port()
+        print(f"GUI at: {args.ip}:{args.port}")
+        network_gui.init(args.ip, args.port)
+    torch.autograd.set_detect_anomaly(args.detect_anomaly)
+    training(dataset, opt, pipe, args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from,
+             args)
+
+    if world_size > 1:
+        torch.distributed.destroy_process_group()
+
 if __name__ == "__main__":
     # Set up command line argument parser
     parser = ArgumentParser(description="Training script parameters")
@@ -308,6 +568,8 @@ if __name__ == "__main__":
     parser.add_argument("--quiet", action="store_true")
     parser.add_argument("--checkpoint_iterations", nargs="+", type=int, default=[])
     parser.add_argument("--start_checkpoint", type=str, default = None)
+    parser.add_argument("--verbose", action="store_true", help="log debug messages of the training loop")
+    parser.add_argument("--legacy_ckpt", action="store_true", help="write checkpoints with torch.save instead of safetensors")
     # Flags for view selections
     parser.add_argument("--method", type=str, default="rand")
     parser.add_argument("--schema", type=str, default="all")
@@ -315,10 +577,19 @@ if __name__ == "__main__":
     parser.add_argument("--reg_lambda", type=float, default=1e-6)
     parser.add_argument("--I_test", action="store_true", help="Use I test to get the selection base")
     parser.add_argument("--I_acq_reg", action="store_true", help="apply reg_lambda to acq H too")
+    parser.add_argument("--num_streams", type=int, default=2, help="cuda streams used when computing the Hessian of views")
+    parser.add_argument("--hessian_batch_size", type=int, default=1, help="training views rendered per backward pass of the training Hessian, larger values keep that many render graphs alive")
+    parser.add_argument("--debug_hreg", action="store_true", help="print acquisition scores of every candidate")
+    parser.add_argument("--world_size", type=int, default=1, help="number of gpus, each renders its own view per iteration")
+    parser.add_argument("--compile", action="store_true", help="torch.compile the training loss")
+    parser.add_argument("--compile_acq", action="store_true", help="torch.compile the acquisition score of view selection")
+    parser.add_argument("--amp", action="store_true", help="compute the training loss in bf16 autocast")
     parser.add_argument("--sh_up_every", type=int, default=5_000, help="increase spherical harmonics every N iterations")
     parser.add_argument("--sh_up_after", type=int, default=-1, help="start to increate active_sh_degree after N iterations")
     parser.add_argument("--min_opacity", type=float, default=0.005, help="min_opacity to prune")
     parser.add_argument("--filter_out_grad", nargs="+", type=str, default=["rotation"])
+    parser.add_argument("--empty_cache_every", type=int, default=0, help="release cached cuda memory every N iterations, 0 disables it")
+    parser.add_argument("--empty_cache_on_eval", action="store_true", help="release cached cuda memory around evaluations")
     parser.add_argument("--log_every_image", action="store_true", help="log every images during traing")
     parser.add_argument("--override_idxs", default=None, type=str, help="speical test idxs on uncertainty evaluation")
 
@@ -334,21 +605,14 @@ if __name__ == "__main__":
 
     print("Optimizing " + args.model_path)
 
-    wandb.init(project='active', resume="allow", id=os.path.split(args.model_path.rstrip('/'))[-1], config=vars(args))
-
-    # Initialize system state (RNG)
-    safe_state(args.quiet, seed=args.seed)
-
-    # Start GUI server, configure and run training
-    args.port = find_free_port()
-    print(f"GUI at: {args.ip}:{args.port}")
-
-
-
-    network_gui.init(args.ip, args.port)
-    torch.autograd.set_detect_anomaly(args.detect_anomaly)
-    training(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from,
-             args)
+    if args.world_size > 1:
+        if not args.model_path:
+            parser.error("--model_path is required with --world_size > 1, so every rank writes to the same folder")
+        init_method = f"tcp://127.0.0.1:{find_free_port()}"
+        mp.spawn(run, args=(args.world_size, init_method, args, lp.extract(args), op.extract(args), pp.extract(args)),
+                 nprocs=args.world_size)
+    else:
+        run(0, 1, None, args, lp.extract(args), op.extract(args), pp.extract(args))
 
     # All done
     print("\nTraining complete.")
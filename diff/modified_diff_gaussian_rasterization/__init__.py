@@ -14,8 +14,25 @@ import torch.nn as nn
 import torch
 from . import _C
 
+# placeholder for the optional inputs of the rasterizer, never written to, so one instance serves every call
+_EMPTY = torch.Tensor([])
+
 def cpu_deep_copy_tuple(input_tuple):
-    copied_tensors = [item.cpu().clone() if isinstance(item, torch.Tensor) else item for item in input_tuple]
+    copied_tensors = list(input_tuple)
+    cuda_items = [(i, item) for i, item in enumerate(input_tuple) if isinstance(item, torch.Tensor) and item.is_cuda]
+    for i, item in enumerate(input_tuple):
+        if isinstance(item, torch.Tensor) and not item.is_cuda:
+            copied_tensors[i] = item.clone()
+    if cuda_items:
+        # all device tensors go to pinned buffers on one side stream, with a single sync at the end
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for i, item in cuda_items:
+                host = torch.empty_like(item, device="cpu", pin_memory=True)
+                host.copy_(item, non_blocking=True)
+                copied_tensors[i] = host
+        stream.synchronize()
     return tuple(copied_tensors)
 
 def rasterize_gaussians(
@@ -197,16 +214,16 @@ class GaussianRasterizer(nn.Module):
             raise Exception('Please provide exactly one of either scale/rotation pair or precomputed 3D covariance!')
         
         if shs is None:
-            shs = torch.Tensor([])
+            shs = _EMPTY
         if colors_precomp is None:
-            colors_precomp = torch.Tensor([])
+            colors_precomp = _EMPTY
 
         if scales is None:
-            scales = torch.Tensor([])
+            scales = _EMPTY
         if rotations is None:
-            rotations = torch.Tensor([])
+            rotations = _EMPTY
         if cov3D_precomp is None:
-            cov3D_precomp = torch.Tensor([])
+            cov3D_precomp = _EMPTY
 
         # Invoke C++/CUDA rasterization routine
         return rasterize_gaussians(
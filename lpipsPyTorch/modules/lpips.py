@@ -31,6 +31,10 @@ class LPIPS(nn.Module):
         feat_x, feat_y = self.net(x), self.net(y)
 
         diff = [(fx - fy) ** 2 for fx, fy in zip(feat_x, feat_y)]
-        res = [l(d).mean((2, 3), True) for d, l in zip(diff, self.lin)]
+        # accumulate the layer scores in place instead of concatenating them, the sum is the same
+        out = None
+        for d, l in zip(diff, self.lin):
+            res = l(d).mean((2, 3), True).sum(0, True)
+            out = res if out is None else out.add_(res)
 
-        return torch.sum(torch.cat(res, 0), 0, True)
+        return out
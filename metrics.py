@@ -73,17 +73,20 @@ def evaluate(model_paths):
                     psnrs.append(psnr(renders[idx], gts[idx]))
                     lpipss.append(lpips(renders[idx], gts[idx], net_type='vgg'))
 
-                print("  SSIM : {:>12.7f}".format(torch.tensor(ssims).mean(), ".5"))
-                print("  PSNR : {:>12.7f}".format(torch.tensor(psnrs).mean(), ".5"))
-                print("  LPIPS: {:>12.7f}".format(torch.tensor(lpipss).mean(), ".5"))
+                # one stack and one device to host copy per metric, instead of an element-wise copy on every use
+                ssims, psnrs, lpipss = (torch.stack(m).flatten().cpu() for m in (ssims, psnrs, lpipss))
+
+                print("  SSIM : {:>12.7f}".format(ssims.mean(), ".5"))
+                print("  PSNR : {:>12.7f}".format(psnrs.mean(), ".5"))
+                print("  LPIPS: {:>12.7f}".format(lpipss.mean(), ".5"))
                 print("")
 
-                full_dict[scene_dir][method].update({"SSIM": torch.tensor(ssims).mean().item(),
-                                                        "PSNR": torch.tensor(psnrs).mean().item(),
-                                                        "LPIPS": torch.tensor(lpipss).mean().item()})
-                per_view_dict[scene_dir][method].update({"SSIM": {name: ssim for ssim, name in zip(torch.tensor(ssims).tolist(), image_names)},
-                                                            "PSNR": {name: psnr for psnr, name in zip(torch.tensor(psnrs).tolist(), image_names)},
-                                                            "LPIPS": {name: lp for lp, name in zip(torch.tensor(lpipss).tolist(), image_names)}})
+                full_dict[scene_dir][method].update({"SSIM": ssims.mean().item(),
+                                                        "PSNR": psnrs.mean().item(),
+                                                        "LPIPS": lpipss.mean().item()})
+                per_view_dict[scene_dir][method].update({"SSIM": {name: ssim for ssim, name in zip(ssims.tolist(), image_names)},
+                                                            "PSNR": {name: psnr for psnr, name in zip(psnrs.tolist(), image_names)},
+                                                            "LPIPS": {name: lp for lp, name in zip(lpipss.tolist(), image_names)}})
 
             with open(scene_dir + "/results.json", 'w') as fp:
                 json.dump(full_dict[scene_dir], fp, indent=True)
@@ -72,8 +72,6 @@ def render_set(model_path, name, iteration, train_views, test_views, gaussians,
     # filter_out_idx = [name2idx[k] for k in ["rotation", "rgb", "sh"]]
     filter_out_idx = [name2idx[k] for k in ["rotation", "scale", "xyz", "opacity"]]
     params = [p.requires_grad_(True) for i, p in enumerate(params) if i not in filter_out_idx]
-    optim = torch.optim.SGD(params, 0.)
-    gaussians.optimizer = optim
     device = params[0].device
     # H_train = torch.zeros(sum(p.numel() for p in params), device=params[0].device, dtype=params[0].dtype)
     H_per_gaussian = torch.zeros(params[0].shape[0], device=params[0].device, dtype=params[0].dtype)
@@ -86,12 +84,12 @@ def render_set(model_path, name, iteration, train_views, test_views, gaussians,
 
             render_pkg = modified_render(view, gaussians, pipeline, background)
             pred_img = render_pkg["render"]
-            pred_img.backward(gradient=torch.ones_like(pred_img))
+            # read the grads from the graph instead of .grad, so there is nothing to zero afterwards
+            grads = torch.autograd.grad(pred_img.sum(), params)
             pixel_gaussian_counter = render_pkg["pixel_gaussian_counter"]
             # render_pkg = modified_render(view, gaussians, pipeline, background, override_color=torch.ones_like(params[1]))
-            H_per_gaussian += sum([reduce(p.grad.detach(), "n ... -> n", "sum") for p in params])
+            H_per_gaussian += sum([reduce(g, "n ... -> n", "sum") for g in grads])
             # render_pkg = modified_render(view, gaussians, pipeline, background, override_color=H_per_gaussian.detach())
-            optim.zero_grad(set_to_none = True) 
 
             split = "train" if idx < len(train_views) else "test"
 
@@ -138,17 +136,15 @@ def render_set_current(model_path, name, iteration, train_views, test_views, gau
     name2idx = {"xyz": 0, "rgb": 1, "sh": 2, "scale": 3, "rotation": 4, "opacity": 5}
     filter_out_idx = [name2idx[k] for k in ["rotation"]]
     params = [p.requires_grad_(True) for i, p in enumerate(params) if i not in filter_out_idx]
-    optim = torch.optim.SGD(params, 0.)
-    gaussians.optimizer = optim
     device = params[0].device
 
     for idx, view in enumerate(tqdm(test_views, desc="Rendering on test set")):
 
         render_pkg = modified_render(view, gaussians, pipeline, background)
         pred_img = render_pkg["render"]
-        pred_img.backward(gradient=torch.ones_like(pred_img))
+        grads = torch.autograd.grad(pred_img.sum(), params)
         pixel_gaussian_counter = render_pkg["pixel_gaussian_counter"]
-        H_per_gaussian = sum(reduce(p.grad.detach(), "n ... -> n", "sum") for p in params)
+        H_per_gaussian = sum(reduce(g, "n ... -> n", "sum") for g in grads)
 
         with torch.no_grad():
             hessian_color = repeat(H_per_gaussian.detach(), "n -> n c", c=3)
@@ -181,8 +177,6 @@ def render_set_current(model_path, name, iteration, train_views, test_views, gau
                         depth=depth.cpu(),
                         )
 
-            optim.zero_grad(set_to_none = True) 
-
     
 
 
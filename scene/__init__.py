@@ -10,37 +10,77 @@
 #
 
 import os
+import io
 import random
+import torch
 import json
+import itertools
+try:
+    import orjson
+    ORJSON_FOUND = True
+except ImportError:
+    ORJSON_FOUND = False
+from functools import partial
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from utils.system_utils import searchForMaxIteration
+from utils.dist_utils import is_main_process
 from scene.dataset_readers import sceneLoadTypeCallbacks
 from scene.gaussian_model import GaussianModel
 from arguments import ModelParams
-from utils.camera_utils import cameraList_from_camInfos, camera_to_JSON, load_cam_info
-from tqdm import tqdm
+from utils.camera_utils import cameraList_from_camInfos, cameras_to_JSON, load_cam_info, thread_map
+
+def _gather(cameras, idxs):
+    # itemgetter fetches all the views in one call, it returns a bare item for a single index and needs at least one
+    if not idxs:
+        return []
+    if len(idxs) == 1:
+        return [cameras[idxs[0]]]
+    return list(itemgetter(*idxs)(cameras))
 
 class Scene:
 
+    # fixed attribute set, looked up from the training and selection loops on every step
+    __slots__ = ("model_path", "_pc_dir", "loaded_iter", "gaussians", "train_cameras", "test_cameras",
+                 "_train_cams_cache", "_candidate_cache", "_centers_cache", "all_train_set", "_max_train_idx",
+                 "train_idxs", "cameras_extent", "candidate_views_filter")
+
     gaussians : GaussianModel
 
     def __init__(self, args : ModelParams, gaussians : GaussianModel, load_iteration=None, shuffle=True, resolution_scales=[1.0],
-                  llffhold=8, override_train_idxs=None, override_test_idxs=None):
+                  llffhold=8, override_train_idxs=None, override_test_idxs=None, shuffle_test=False):
         """b
         :param path: Path to colmap scene main folder.
         """
         self.model_path = args.model_path
+        # point_cloud/iteration_N/point_cloud.ply of every save and load is under this directory
+        self._pc_dir = os.path.join(self.model_path, "point_cloud")
         self.loaded_iter = None
         self.gaussians = gaussians
 
         if load_iteration:
             if load_iteration == -1:
-                self.loaded_iter = searchForMaxIteration(os.path.join(self.model_path, "point_cloud"))
+                self.loaded_iter = searchForMaxIteration(self._pc_dir)
             else:
                 self.loaded_iter = load_iteration
             print("Loading trained model at iteration {}".format(self.loaded_iter))
 
+        ply_future = None
+        if self.loaded_iter:
+            # read the point cloud from disk while the scene and cameras load, it is parsed once they are done
+            ply_executor = ThreadPoolExecutor(max_workers=1)
+            ply_future = ply_executor.submit(self._read_bytes, os.path.join(self._pc_dir, f"iteration_{self.loaded_iter}",
+                                                                           "point_cloud.ply"))
+            ply_executor.shutdown(wait=False)
+
         self.train_cameras = {}
         self.test_cameras = {}
+        # scale -> (train_idxs, number of cameras, train cameras) of the last getTrainCameras
+        self._train_cams_cache = {}
+        # (train_idxs, number of train views, filter, candidate set) of the last get_candidate_set
+        self._candidate_cache = None
+        # scale -> (number of cameras, stacked camera centers) of the last getTrainCameraCenters
+        self._centers_cache = {}
 
         if os.path.exists(os.path.join(args.source_path, "sparse")):
             scene_info = sceneLoadTypeCallbacks["Colmap"](args.source_path, args.images, args.eval, 
@@ -51,29 +91,33 @@ class Scene:
         else:
             assert False, "Could not recognize scene type!"
 
-        if not self.loaded_iter:
+        # every rank builds the scene when training distributed, only the main process writes the shared files
+        if not self.loaded_iter and is_main_process():
             with open(scene_info.ply_path, 'rb') as src_file, open(os.path.join(self.model_path, "input.ply") , 'wb') as dest_file:
                 dest_file.write(src_file.read())
-            json_cams = []
-            camlist = []
-            if scene_info.test_cameras:
-                camlist.extend(scene_info.test_cameras)
-            if scene_info.train_cameras:
-                camlist.extend(scene_info.train_cameras)
-            for id, cam in enumerate(camlist):
-                json_cams.append(camera_to_JSON(id, cam))
-            with open(os.path.join(self.model_path, "cameras.json"), 'w') as file:
-                json.dump(json_cams, file)
+            camlist = list(itertools.chain(scene_info.test_cameras or [], scene_info.train_cameras or []))
+            json_cams = cameras_to_JSON(camlist)
+            # orjson encodes the whole list to bytes in C and writes it at once, json is the fallback
+            if ORJSON_FOUND:
+                with open(os.path.join(self.model_path, "cameras.json"), 'wb') as file:
+                    file.write(orjson.dumps(json_cams))
+            else:
+                with open(os.path.join(self.model_path, "cameras.json"), 'w') as file:
+                    json.dump(json_cams, file)
 
         num_views = len(scene_info.train_cameras)
         self.all_train_set = set(range(num_views))
+        # largest index in all_train_set, inflated cameras are numbered after it
+        self._max_train_idx = num_views - 1
         self.train_idxs = list(range(num_views))
         if shuffle:
             # Make this determinisjtic
             random.Random(42).shuffle(self.train_idxs)
             # The scene_info doesn't need to be shuffled 
             # random.Random(42).shuffle(scene_info.train_cameras)
-            random.shuffle(scene_info.test_cameras)  # Multi-res consistent random shuffling
+            # the test views only feed averaged metrics and the logged samples, keep them in loaded order unless asked
+            if shuffle_test:
+                random.Random(43).shuffle(scene_info.test_cameras)  # Multi-res consistent random shuffling
 
         self.cameras_extent = scene_info.nerf_normalization["radius"]
 
@@ -84,22 +128,41 @@ class Scene:
             self.test_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.test_cameras, resolution_scale, args)
 
         if self.loaded_iter:
-            self.gaussians.load_ply(os.path.join(self.model_path,
-                                                           "point_cloud",
-                                                           "iteration_" + str(self.loaded_iter),
-                                                           "point_cloud.ply"))
+            self.gaussians.load_ply(io.BytesIO(ply_future.result()))
         else:
             self.gaussians.create_from_pcd(scene_info.point_cloud, self.cameras_extent)
         
         self.candidate_views_filter = None
 
-    def save(self, iteration):
-        point_cloud_path = os.path.join(self.model_path, "point_cloud/iteration_{}".format(iteration))
-        self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
+    @staticmethod
+    def _read_bytes(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def save(self, iteration, executor=None):
+        point_cloud_path = os.path.join(self._pc_dir, f"iteration_{iteration}")
+        return self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"), executor=executor)
 
     def getTrainCameras(self, scale=1.0):
-        filted_train_camers = [self.train_cameras[scale][i] for i in self.train_idxs]
-        return filted_train_camers
+        # rebuilt only when train_idxs changed (selection, checkpoint load) or cameras were inflated
+        cameras = self.train_cameras[scale]
+        cached = self._train_cams_cache.get(scale)
+        if cached is None or cached[1] != len(cameras) or cached[0] != self.train_idxs:
+            cached = (list(self.train_idxs), len(cameras), _gather(cameras, self.train_idxs))
+            self._train_cams_cache[scale] = cached
+        # callers are free to modify the returned list
+        return list(cached[2])
+
+    def getTrainCameraCenters(self, scale=1.0):
+        """
+        Centers of all train views, candidates included, as one (N, 3) tensor indexed like train_cameras
+        """
+        cameras = self.train_cameras[scale]
+        cached = self._centers_cache.get(scale)
+        if cached is None or cached[0] != len(cameras):
+            cached = (len(cameras), torch.stack([cam.camera_center for cam in cameras]))
+            self._centers_cache[scale] = cached
+        return cached[1]
 
     def getTestCameras(self, scale=1.0):
         return self.test_cameras[scale]
@@ -107,30 +170,42 @@ class Scene:
     def get_candidate_set(self):
         # Get candidate set 
         # Ensure resutls are always the same
-        candidate_set = sorted(list(self.all_train_set - set(self.train_idxs)))
-        if self.candidate_views_filter is not None:
-            candidate_set = list(filter(self.candidate_views_filter, candidate_set))
-        return candidate_set
+        # recomputed only when train_idxs, the train views (inflation) or the filter changed, like getTrainCameras
+        cached = self._candidate_cache
+        if (cached is None or cached[0] != self.train_idxs or cached[1] != len(self.all_train_set)
+                or cached[2] is not self.candidate_views_filter):
+            candidate_set = sorted(self.all_train_set.difference(self.train_idxs))
+            if self.candidate_views_filter is not None:
+                candidate_set = list(filter(self.candidate_views_filter, candidate_set))
+            cached = (list(self.train_idxs), len(self.all_train_set), self.candidate_views_filter, candidate_set)
+            self._candidate_cache = cached
+        # callers are free to modify the returned list
+        return list(cached[3])
 
     def getCandidateCameras(self, scale=1.0):
-        candidate_set = list(self.get_candidate_set())
-        filted_train_camers = [self.train_cameras[scale][i] for i in candidate_set]
+        candidate_set = self.get_candidate_set()
+        filted_train_camers = _gather(self.train_cameras[scale], candidate_set)
         return filted_train_camers
     
     def load_inflated_cameras(self, info_path: str, inflate_skip: int):
-        with open(info_path, "r") as f:
-            info_dict = json.load(f)
+        if ORJSON_FOUND:
+            with open(info_path, "rb") as f:
+                info_dict = orjson.loads(f.read())
+        else:
+            with open(info_path, "r") as f:
+                info_dict = json.load(f)
 
         base_path = os.path.dirname(info_path)
 
         for scale in self.train_cameras.keys():
             assert scale == 1., "Didn't implement for other scale"
-            base_idx = max(self.all_train_set) + 1
+            base_idx = self._max_train_idx + 1
 
-            load_idxs = [idx for idx in range(len(info_dict)) if idx % inflate_skip == 0]
-            load_dicts = [info_dict[i] for i in load_idxs]
+            load_dicts = info_dict[::inflate_skip]
 
-            inflated_cams = [load_cam_info(d, base_path=base_path) for d in tqdm(load_dicts, desc="Loading inflated cams")]
+            # image reads and PIL decodes release the GIL, the cameras keep the info_dict order
+            inflated_cams = thread_map(partial(load_cam_info, base_path=base_path), load_dicts, desc="Loading inflated cams")
 
-            self.all_train_set.update([base_idx + i for i, _ in enumerate(load_idxs)])
+            self.all_train_set.update(range(base_idx, base_idx + len(load_dicts)))
+            self._max_train_idx = base_idx + len(load_dicts) - 1
             self.train_cameras[scale].extend(inflated_cams)
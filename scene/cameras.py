@@ -45,6 +45,10 @@ class Camera(nn.Module):
         else:
             self.original_image *= torch.ones((1, self.image_height, self.image_width), device=self.data_device)
 
+        # images kept on host are page-locked, so the per-iteration upload is an async DMA
+        if self.data_device.type == "cpu" and torch.cuda.is_available():
+            self.original_image = self.original_image.pin_memory()
+
         self.zfar = 100.0
         self.znear = 0.01
 
@@ -188,25 +188,37 @@ class GaussianModel:
             l.append('rot_{}'.format(i))
         return l
 
-    def save_ply(self, path):
+    def ply_attributes(self):
+        """
+        Host copy of the per point attributes in construct_list_of_attributes() order, with a single device to host copy
+        """
+        xyz = self._xyz.detach()
+        normals = torch.zeros_like(xyz)
+        f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1)
+        f_rest = self._features_rest.detach().transpose(1, 2).flatten(start_dim=1)
+        attributes = torch.cat((xyz, normals, f_dc, f_rest, self._opacity.detach(), self._scaling.detach(), self._rotation.detach()), dim=1)
+        return attributes.cpu().numpy()
+
+    @staticmethod
+    def write_ply(path, attributes, attribute_names):
         mkdir_p(os.path.dirname(path))
 
-        xyz = self._xyz.detach().cpu().numpy()
-        normals = np.zeros_like(xyz)
-        f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        f_rest = self._features_rest.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        opacities = self._opacity.detach().cpu().numpy()
-        scale = self._scaling.detach().cpu().numpy()
-        rotation = self._rotation.detach().cpu().numpy()
+        dtype_full = [(attribute, 'f4') for attribute in attribute_names]
 
-        dtype_full = [(attribute, 'f4') for attribute in self.construct_list_of_attributes()]
-
-        elements = np.empty(xyz.shape[0], dtype=dtype_full)
-        attributes = np.concatenate((xyz, normals, f_dc, f_rest, opacities, scale, rotation), axis=1)
-        elements[:] = list(map(tuple, attributes))
+        # the rows already hold the fields in order, viewed as records instead of converted point by point
+        elements = np.ascontiguousarray(attributes, dtype=np.float32).view(dtype_full).reshape(-1)
         el = PlyElement.describe(elements, 'vertex')
         PlyData([el]).write(path)
 
+    def save_ply(self, path, executor=None):
+        """
+        Write the point cloud, in the background when given an executor, the attributes are copied to host before returning
+        """
+        attributes = self.ply_attributes()
+        if executor is None:
+            return self.write_ply(path, attributes, self.construct_list_of_attributes())
+        return executor.submit(self.write_ply, path, attributes, self.construct_list_of_attributes())
+
     def reset_opacity(self):
         opacities_new = inverse_sigmoid(torch.min(self.get_opacity, torch.ones_like(self.get_opacity)*0.01))
         optimizable_tensors = self.replace_tensor_to_optimizer(opacities_new, "opacity")
@@ -214,44 +226,34 @@ class GaussianModel:
 
     def load_ply(self, path):
         plydata = PlyData.read(path)
+        vertices = plydata.elements[0]
 
-        xyz = np.stack((np.asarray(plydata.elements[0]["x"]),
-                        np.asarray(plydata.elements[0]["y"]),
-                        np.asarray(plydata.elements[0]["z"])),  axis=1)
-        opacities = np.asarray(plydata.elements[0]["opacity"])[..., np.newaxis]
-
-        features_dc = np.zeros((xyz.shape[0], 3, 1))
-        features_dc[:, 0, 0] = np.asarray(plydata.elements[0]["f_dc_0"])
-        features_dc[:, 1, 0] = np.asarray(plydata.elements[0]["f_dc_1"])
-        features_dc[:, 2, 0] = np.asarray(plydata.elements[0]["f_dc_2"])
-
-        extra_f_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("f_rest_")]
+        extra_f_names = [p.name for p in vertices.properties if p.name.startswith("f_rest_")]
         extra_f_names = sorted(extra_f_names, key = lambda x: int(x.split('_')[-1]))
         assert len(extra_f_names)==3*(self.max_sh_degree + 1) ** 2 - 3
-        features_extra = np.zeros((xyz.shape[0], len(extra_f_names)))
-        for idx, attr_name in enumerate(extra_f_names):
-            features_extra[:, idx] = np.asarray(plydata.elements[0][attr_name])
-        # Reshape (P,F*SH_coeffs) to (P, F, SH_coeffs except DC)
-        features_extra = features_extra.reshape((features_extra.shape[0], 3, (self.max_sh_degree + 1) ** 2 - 1))
 
-        scale_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("scale_")]
+        scale_names = [p.name for p in vertices.properties if p.name.startswith("scale_")]
         scale_names = sorted(scale_names, key = lambda x: int(x.split('_')[-1]))
-        scales = np.zeros((xyz.shape[0], len(scale_names)))
-        for idx, attr_name in enumerate(scale_names):
-            scales[:, idx] = np.asarray(plydata.elements[0][attr_name])
 
-        rot_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("rot")]
+        rot_names = [p.name for p in vertices.properties if p.name.startswith("rot")]
         rot_names = sorted(rot_names, key = lambda x: int(x.split('_')[-1]))
-        rots = np.zeros((xyz.shape[0], len(rot_names)))
-        for idx, attr_name in enumerate(rot_names):
-            rots[:, idx] = np.asarray(plydata.elements[0][attr_name])
 
-        self._xyz = nn.Parameter(torch.tensor(xyz, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._features_dc = nn.Parameter(torch.tensor(features_dc, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._features_rest = nn.Parameter(torch.tensor(features_extra, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._opacity = nn.Parameter(torch.tensor(opacities, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._scaling = nn.Parameter(torch.tensor(scales, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._rotation = nn.Parameter(torch.tensor(rots, dtype=torch.float, device="cuda").requires_grad_(True))
+        # the binary vertex fields are gathered into one float32 array, uploaded once and split on the device
+        names = ["x", "y", "z", "f_dc_0", "f_dc_1", "f_dc_2"] + extra_f_names + ["opacity"] + scale_names + rot_names
+        attributes = np.stack([np.asarray(vertices[name], dtype=np.float32) for name in names], axis=1)
+        attributes = torch.from_numpy(attributes).to("cuda")
+        xyz, features_dc, features_extra, opacities, scales, rots = attributes.split(
+            [3, 3, len(extra_f_names), 1, len(scale_names), len(rot_names)], dim=1)
+        # Reshape (P,F*SH_coeffs) to (P, F, SH_coeffs except DC)
+        features_dc = features_dc.reshape(-1, 3, 1)
+        features_extra = features_extra.reshape(-1, 3, (self.max_sh_degree + 1) ** 2 - 1)
+
+        self._xyz = nn.Parameter(xyz.contiguous().requires_grad_(True))
+        self._features_dc = nn.Parameter(features_dc.transpose(1, 2).contiguous().requires_grad_(True))
+        self._features_rest = nn.Parameter(features_extra.transpose(1, 2).contiguous().requires_grad_(True))
+        self._opacity = nn.Parameter(opacities.contiguous().requires_grad_(True))
+        self._scaling = nn.Parameter(scales.contiguous().requires_grad_(True))
+        self._rotation = nn.Parameter(rots.contiguous().requires_grad_(True))
 
         self.active_sh_degree = self.max_sh_degree
 
@@ -386,9 +388,10 @@ class GaussianModel:
 
         self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation)
 
-    def densify_and_prune(self, max_grad, min_opacity, extent, max_screen_size):
+    def densify_and_prune(self, max_grad, min_opacity, extent, max_screen_size, empty_cache=True):
         grads = self.xyz_gradient_accum / self.denom
-        grads[grads.isnan()] = 0.0
+        # masked_fill_ instead of boolean indexing, which needs a nonzero() and a device sync
+        grads.masked_fill_(grads.isnan(), 0.0)
 
         self.densify_and_clone(grads, max_grad, extent)
         self.densify_and_split(grads, max_grad, extent)
@@ -400,11 +403,16 @@ class GaussianModel:
             prune_mask = torch.logical_or(torch.logical_or(prune_mask, big_points_vs), big_points_ws)
         self.prune_points(prune_mask)
 
-        torch.cuda.empty_cache()
+        # callers that manage the allocator themselves pass empty_cache=False
+        if empty_cache:
+            torch.cuda.empty_cache()
 
     def add_densification_stats(self, viewspace_point_tensor, update_filter):
-        self.xyz_gradient_accum[update_filter] += torch.norm(viewspace_point_tensor.grad[update_filter,:2], dim=-1, keepdim=True)
-        self.denom[update_filter] += 1
+        # dense masked adds, boolean indexing would gather/scatter and sync on the number of visible points
+        mask = update_filter.unsqueeze(-1)
+        grad_norm = torch.norm(viewspace_point_tensor.grad[:, :2], dim=-1, keepdim=True)
+        self.xyz_gradient_accum.add_(torch.where(mask, grad_norm, 0.))
+        self.denom.add_(mask)
 
     def add_random_gaussians(self, num_pts: int, extent: float, expand_ratio=2.0):
         expaned_radius = extent * expand_ratio
@@ -14,9 +14,38 @@ import numpy as np
 from utils.general_utils import PILtoTorch
 from utils.graphics_utils import fov2focal
 from PIL import Image
+import os
+import threading
 import torch
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
 
 WARNED = False
+# cameras of a list are loaded from several threads, the warning is still printed once
+_WARNED_LOCK = threading.Lock()
+
+def num_loader_workers():
+    # reads, PIL decodes and uploads release the GIL, a few threads per core keep the disk busy
+    return min(32, (os.cpu_count() or 1) * 4)
+
+def thread_map(fn, items, desc=None):
+    """
+    fn over items on a thread pool, in order, the workers use the cuda device of the caller instead of cuda:0
+    """
+    # the current device is per thread, pool threads would otherwise start on device 0 whatever the rank
+    device = torch.cuda.current_device() if torch.cuda.is_available() else None
+
+    def call(item):
+        if device is None:
+            return fn(item)
+        with torch.cuda.device(device):
+            return fn(item)
+
+    with ThreadPoolExecutor(max_workers=num_loader_workers()) as ex:
+        results = ex.map(call, items)
+        if desc is not None:
+            results = tqdm(results, total=len(items), desc=desc)
+        return list(results)
 
 def loadCam(args, id, cam_info, resolution_scale):
     orig_w, orig_h = cam_info.image.size
@@ -27,10 +56,11 @@ def loadCam(args, id, cam_info, resolution_scale):
         if args.resolution == -1:
             if orig_w > 1600:
                 global WARNED
-                if not WARNED:
-                    print("[ INFO ] Encountered quite large input images (>1.6K pixels width), rescaling to 1.6K.\n "
-                        "If this is not desired, please explicitly specify '--resolution/-r' as 1")
-                    WARNED = True
+                with _WARNED_LOCK:
+                    if not WARNED:
+                        print("[ INFO ] Encountered quite large input images (>1.6K pixels width), rescaling to 1.6K.\n "
+                            "If this is not desired, please explicitly specify '--resolution/-r' as 1")
+                        WARNED = True
                 global_down = orig_w / 1600
             else:
                 global_down = 1
@@ -54,12 +84,8 @@ def loadCam(args, id, cam_info, resolution_scale):
                   image_name=cam_info.image_name, uid=id, data_device=args.data_device)
 
 def cameraList_from_camInfos(cam_infos, resolution_scale, args):
-    camera_list = []
-
-    for id, c in enumerate(cam_infos):
-        camera_list.append(loadCam(args, id, c, resolution_scale))
-
-    return camera_list
+    # the resize, the conversion to a tensor and the upload of each view run in native code that releases the GIL
+    return thread_map(lambda item: loadCam(args, item[0], item[1], resolution_scale), list(enumerate(cam_infos)))
 
 def camera_to_JSON(id, camera : Camera):
     Rt = np.zeros((4, 4))
@@ -67,7 +93,23 @@ def camera_to_JSON(id, camera : Camera):
     Rt[:3, 3] = camera.T
     Rt[3, 3] = 1.0
 
+    return _camera_entry(id, camera, np.linalg.inv(Rt))
+
+def cameras_to_JSON(cameras):
+    """
+    camera_to_JSON of every camera, ids being list positions, with one batched inverse for all the poses
+    """
+    if not cameras:
+        return []
+    Rt = np.zeros((len(cameras), 4, 4))
+    Rt[:, :3, :3] = np.stack([camera.R for camera in cameras]).transpose(0, 2, 1)
+    Rt[:, :3, 3] = np.stack([camera.T for camera in cameras])
+    Rt[:, 3, 3] = 1.0
+
     W2C = np.linalg.inv(Rt)
+    return [_camera_entry(id, camera, W2C[id]) for id, camera in enumerate(cameras)]
+
+def _camera_entry(id, camera, W2C):
     pos = W2C[:3, 3]
     rot = W2C[:3, :3]
     serializable_array_2d = [x.tolist() for x in rot]
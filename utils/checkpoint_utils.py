@@ -0,0 +1,61 @@
+import json
+import numpy as np
+import torch
+try:
+    from safetensors import safe_open
+    from safetensors.torch import save as safetensors_save
+    SAFETENSORS_FOUND = True
+except ImportError:
+    SAFETENSORS_FOUND = False
+
+
+def flatten_state(obj, tensors):
+    """
+    Skeleton of `obj` that json can encode, its tensors are moved into `tensors` under generated keys
+    """
+    if isinstance(obj, torch.Tensor):
+        key = str(len(tensors))
+        tensors[key] = obj
+        return {"tensor": key, "param": isinstance(obj, torch.nn.Parameter), "requires_grad": obj.requires_grad}
+    if isinstance(obj, dict):
+        # optimizer states are keyed by ints, keep the keys as they are instead of json object keys
+        return {"dict": [[flatten_state(k, tensors), flatten_state(v, tensors)] for k, v in obj.items()]}
+    if isinstance(obj, tuple):
+        return {"tuple": [flatten_state(v, tensors) for v in obj]}
+    if isinstance(obj, list):
+        return {"list": [flatten_state(v, tensors) for v in obj]}
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    return {"value": obj}
+
+def unflatten_state(skeleton, tensors):
+    if "tensor" in skeleton:
+        t = tensors[skeleton["tensor"]]
+        return torch.nn.Parameter(t, requires_grad=skeleton["requires_grad"]) if skeleton["param"] else t
+    if "dict" in skeleton:
+        return {unflatten_state(k, tensors): unflatten_state(v, tensors) for k, v in skeleton["dict"]}
+    if "tuple" in skeleton:
+        return tuple(unflatten_state(v, tensors) for v in skeleton["tuple"])
+    if "list" in skeleton:
+        return [unflatten_state(v, tensors) for v in skeleton["list"]]
+    return skeleton["value"]
+
+def save_safetensors(obj) -> bytes:
+    """
+    Serialize a checkpoint of host tensors, the python structure around them is kept as json in the header metadata
+    """
+    tensors = {}
+    skeleton = flatten_state(obj, tensors)
+    return safetensors_save({k: t.contiguous() for k, t in tensors.items()}, metadata={"skeleton": json.dumps(skeleton)})
+
+def load_safetensors(path):
+    with safe_open(path, framework="pt") as f:
+        skeleton = json.loads(f.metadata()["skeleton"])
+        tensors = {k: f.get_tensor(k) for k in f.keys()}
+    return unflatten_state(skeleton, tensors)
+
+def is_safetensors(path) -> bool:
+    # an 8 byte header length followed by the json header, torch.save files are zip archives or pickles
+    with open(path, "rb") as f:
+        head = f.read(9)
+    return len(head) == 9 and head[8:9] == b"{"
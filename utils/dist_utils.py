@@ -0,0 +1,65 @@
+import torch
+import torch.distributed as dist
+
+# cpu group for the small host side agreements (exit flags), so they do not sync with the GPU
+_host_group = None
+
+def init_distributed(rank, world_size, init_method, timeout):
+    global _host_group
+    torch.cuda.set_device(rank)
+    dist.init_process_group("nccl", init_method=init_method, rank=rank, world_size=world_size, timeout=timeout)
+    _host_group = dist.new_group(backend="gloo", timeout=timeout)
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+def is_main_process():
+    return get_rank() == 0
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+def all_reduce_grads(params):
+    """
+    Average the gradients of `params` over ranks, the reductions are issued together and waited on at the end
+    """
+    world_size = get_world_size()
+    if world_size == 1:
+        return
+    grads = [p.grad for p in params if p.grad is not None]
+    works = [dist.all_reduce(g, async_op=True) for g in grads]
+    for work in works:
+        work.wait()
+    for g in grads:
+        g.div_(world_size)
+
+def all_reduce_densification_stats(gaussians):
+    """
+    Merge the screen-space stats gathered by every rank, so all replicas densify and prune the same points
+    """
+    if get_world_size() == 1:
+        return
+    dist.all_reduce(gaussians.xyz_gradient_accum)
+    dist.all_reduce(gaussians.denom)
+    dist.all_reduce(gaussians.max_radii2D, op=dist.ReduceOp.MAX)
+
+def broadcast_object(obj, src=0):
+    if get_world_size() == 1:
+        return obj
+    objs = [obj]
+    dist.broadcast_object_list(objs, src=src, group=_host_group)
+    return objs[0]
+
+def any_rank(flag: bool) -> bool:
+    if get_world_size() == 1:
+        return flag
+    t = torch.tensor([int(flag)])
+    dist.all_reduce(t, op=dist.ReduceOp.MAX, group=_host_group)
+    return bool(t.item())
@@ -44,10 +44,7 @@ def get_expon_lr_func(
     :return HoF which takes step as input
     """
 
-    def helper(step):
-        if step < 0 or (lr_init == 0.0 and lr_final == 0.0):
-            # Disable this parameter
-            return 0.0
+    def schedule(step):
         if lr_delay_steps > 0:
             # A kind of reverse cosine decay.
             delay_rate = lr_delay_mult + (1 - lr_delay_mult) * np.sin(
@@ -59,6 +56,18 @@ def get_expon_lr_func(
         log_lerp = np.exp(np.log(lr_init) * (1 - t) + np.log(lr_final) * t)
         return delay_rate * log_lerp
 
+    disabled = lr_init == 0.0 and lr_final == 0.0
+    # the schedule is evaluated every step, tabulate it once over the integer steps it is called with
+    lut = None if disabled else schedule(np.arange(max_steps + 1, dtype=np.float64)).tolist()
+
+    def helper(step):
+        if step < 0 or disabled:
+            # Disable this parameter
+            return 0.0
+        if isinstance(step, int) and step <= max_steps:
+            return lut[step]
+        return schedule(step)
+
     return helper
 
 def strip_lowerdiag(L):
@@ -109,7 +118,7 @@ def build_scaling_rotation(s, r):
     L = R @ L
     return L
 
-def safe_state(silent, seed=0):
+def safe_state(silent, seed=0, device="cuda:0"):
     old_f = sys.stdout
     class F:
         def __init__(self, silent):
@@ -130,4 +139,5 @@ def safe_state(silent, seed=0):
     random.seed(seed)
     np.random.seed(seed)
     torch.manual_seed(seed)
-    torch.cuda.set_device(torch.device("cuda:0"))
+    # distributed ranks pass their own gpu, the process group is created on it
+    torch.cuda.set_device(torch.device(device))
@@ -13,6 +13,7 @@ import torch
 import torch.nn.functional as F
 from torch.autograd import Variable
 from math import exp
+from functools import lru_cache
 
 def l1_loss(network_output, gt):
     return torch.abs((network_output - gt)).mean()
@@ -30,32 +31,49 @@ def create_window(window_size, channel):
     window = Variable(_2D_window.expand(channel, 1, window_size, window_size).contiguous())
     return window
 
+def create_window_1d(window_size, channel):
+    # the gaussian window is the outer product of this one with itself, the 2D blur is a row pass and a column pass
+    return gaussian(window_size, 1.5).float().expand(channel, 1, window_size).contiguous()
+
+@lru_cache(maxsize=None)
+def get_window(window_size, channel, device, dtype):
+    # built and uploaded once per configuration instead of on every ssim call, as a normal tensor even when first
+    # requested under inference mode, since training saves it for backward
+    with torch.inference_mode(False):
+        return create_window_1d(window_size, channel).to(device=device, dtype=dtype)
+
 def ssim(img1, img2, window_size=11, size_average=True):
     channel = img1.size(-3)
-    window = create_window(window_size, channel)
-
-    if img1.is_cuda:
-        window = window.cuda(img1.get_device())
-    window = window.type_as(img1)
+    # one window per blurred map: img1, img2, img1^2, img2^2 and img1*img2
+    window = get_window(window_size, 5 * channel, img1.device, img1.dtype)
 
     return _ssim(img1, img2, window, window_size, channel, size_average)
 
-def _ssim(img1, img2, window, window_size, channel, size_average=True):
-    mu1 = F.conv2d(img1, window, padding=window_size // 2, groups=channel)
-    mu2 = F.conv2d(img2, window, padding=window_size // 2, groups=channel)
-
+@torch.jit.script
+def _ssim_map(mu1, mu2, conv11, conv22, conv12, C1: float, C2: float):
+    # scripted so the fuser runs the pointwise part of ssim as one kernel instead of a dozen full image passes
     mu1_sq = mu1.pow(2)
     mu2_sq = mu2.pow(2)
     mu1_mu2 = mu1 * mu2
 
-    sigma1_sq = F.conv2d(img1 * img1, window, padding=window_size // 2, groups=channel) - mu1_sq
-    sigma2_sq = F.conv2d(img2 * img2, window, padding=window_size // 2, groups=channel) - mu2_sq
-    sigma12 = F.conv2d(img1 * img2, window, padding=window_size // 2, groups=channel) - mu1_mu2
+    sigma1_sq = conv11 - mu1_sq
+    sigma2_sq = conv22 - mu2_sq
+    sigma12 = conv12 - mu1_mu2
+
+    return ((2 * mu1_mu2 + C1) * (2 * sigma12 + C2)) / ((mu1_sq + mu2_sq + C1) * (sigma1_sq + sigma2_sq + C2))
+
+def _ssim(img1, img2, window, window_size, channel, size_average=True):
+    # the five blurs run as one grouped, separable convolution (2 x window_size taps per pixel instead of
+    # window_size^2), zero padding commutes with the separable window so the maps match the 2D convolution
+    maps = torch.cat([img1, img2, img1 * img1, img2 * img2, img1 * img2], dim=-3)
+    maps = F.conv2d(maps, window.unsqueeze(-1), padding=(window_size // 2, 0), groups=5 * channel)
+    maps = F.conv2d(maps, window.unsqueeze(-2), padding=(0, window_size // 2), groups=5 * channel)
+    mu1, mu2, conv11, conv22, conv12 = maps.split(channel, dim=-3)
 
     C1 = 0.01 ** 2
     C2 = 0.03 ** 2
 
-    ssim_map = ((2 * mu1_mu2 + C1) * (2 * sigma12 + C2)) / ((mu1_sq + mu2_sq + C1) * (sigma1_sq + sigma2_sq + C2))
+    ssim_map = _ssim_map(mu1, mu2, conv11, conv22, conv12, C1, C2)
 
     if size_average:
         return ssim_map.mean()